@@ -1,47 +1,46 @@
 import streamlit as st  # Import python packages
-import json
-import snowflake.snowpark.functions as F
-from datetime import timedelta, datetime as dt
-from langchain_text_splitters import CharacterTextSplitter
-import tiktoken
-import pickle
-import os
+from common.startup import import_budget, start_warm_up
 
-from typing import Any, Dict, List, Optional
-import time
-import json
-
-from snowflake.cortex import Complete
-from langchain_core.callbacks.manager import CallbackManagerForLLMRun
-from langchain_core.language_models.llms import LLM
-
-from langchain_core.prompts import PromptTemplate
-from langchain.chains import StuffDocumentsChain, MapReduceDocumentsChain, ReduceDocumentsChain, LLMChain
-from langchain.cache import InMemoryCache
-from langchain.globals import set_llm_cache
-
-from snowflake.snowpark.types import StructType, StructField, StringType, DateType, TimestampType, VariantType
-import datetime
-from common.app_tools import connect_to_snowflake
+with import_budget("Summary"):
+    import json
+    from common.app_tools import get_session_pool
+    from common.query_cache import query_cache, SUMMARY_TABLES
 
 
 st.title(":telephone_receiver: Support Case Summary (powered by Cortex LLMs)")
 
 # Establishing session
-session = connect_to_snowflake()
-current_database = session.get_current_database()
+session_pool = get_session_pool()
+start_warm_up(session_pool)
+with session_pool.session(query_tag="summary_page") as session:
+    current_database = session.get_current_database()
 print(current_database)
 current_schema = "SUPPORT"
 
 
 def get_tables():
-    return session.sql(
-        f"""SHOW TABLES LIKE '%SUM%' IN SCHEMA {current_database}.{current_schema}"""
-    ).collect()
+    with session_pool.session(query_tag="summary_page") as session:
+        return query_cache.get(
+            session,
+            SUMMARY_TABLES,
+            (current_database, current_schema),
+            lambda: session.sql(
+                f"""SHOW TABLES LIKE '%SUM%' IN SCHEMA {current_database}.{current_schema}"""
+            ).collect(),
+            versioned=False,
+        )
 
 
 def get_analysis(table):
-    return session.table(f"{current_database}.{current_schema}.{table}").to_pandas()
+    with session_pool.session(query_tag="summary_page") as session:
+        return query_cache.get(
+            session,
+            table,
+            (current_database, current_schema),
+            lambda: session.table(
+                f"{current_database}.{current_schema}.{table}"
+            ).to_pandas(),
+        )
 
 
 tables_list = get_tables()
@@ -60,4 +59,20 @@ if table:
         # for each value in the json array for the column "INTERMEDIATE_STEPS", create a streamlit (ideally collapsible) markdown for the value
         json_steps = json.loads(most_recent_record["INTERMEDIATE_STEPS"])
         for step in json_steps:
-            st.markdown(step)
\ No newline at end of file
+            st.markdown(step)
+
+    if "CLUSTERS" in analysis_pd and isinstance(most_recent_record["CLUSTERS"], str):
+        with st.expander("Clusters"):
+            for i, cluster in enumerate(json.loads(most_recent_record["CLUSTERS"])):
+                st.markdown(
+                    f"**Cluster {i + 1}** ({cluster['size']} cases): "
+                    + ", ".join(cluster["case_ids"])
+                )
+
+    if "DEDUP_GROUPS" in analysis_pd and isinstance(most_recent_record["DEDUP_GROUPS"], str):
+        with st.expander("Near-duplicate cases"):
+            for group in json.loads(most_recent_record["DEDUP_GROUPS"]):
+                st.markdown(
+                    f"**{group['representative_case_id']}** stands for {group['size']} cases: "
+                    + ", ".join(group["case_ids"])
+                )
@@ -1,9 +1,10 @@
-from snowflake.snowpark import Session
 import os
 import streamlit as st
 
-@st.cache_resource
-def connect_to_snowflake():
+from .session_pool import SessionPool
+
+
+def _connection_config():
     try:
         username = os.environ["DATAOPS_SNOWFLAKE_USER"]
         password = os.environ["DATAOPS_SNOWFLAKE_PASSWORD"]
@@ -12,18 +13,71 @@ def connect_to_snowflake():
         role = str(os.getenv("DATAOPS_CATALOG_SOLUTION_PREFIX") + "_ADMIN")
         warehouse = str(os.getenv("DATAOPS_CATALOG_SOLUTION_PREFIX") + "_DATA_APP_WH")
         schema = "SPCS"
-        
+
     except KeyError:
         raise Exception("Could not find one or more required environment variables")
-    
-    return  Session.builder.configs(
-            {
-                "account": account,
-                "user": username,
-                "password": password,
-                "role": role,
-                "warehouse": warehouse,
-                "database": database_name,
-                "schema": "SUPPORT",
-            }
-        ).create()
+
+    return {
+        "account": account,
+        "user": username,
+        "password": password,
+        "role": role,
+        "warehouse": warehouse,
+        "database": database_name,
+        "schema": "SUPPORT",
+    }
+
+
+def create_session():
+    from snowflake.snowpark import Session
+
+    return Session.builder.configs(_connection_config()).create()
+
+
+def create_session_pool(size=None):
+    config = _connection_config()
+    # Sessions are created lazily; the default covers the largest mapping
+    # concurrency the Process Cases page allows plus the page's own queries.
+    return SessionPool(
+        create_session,
+        size=size or int(os.getenv("SNOWFLAKE_SESSION_POOL_SIZE", 12)),
+        role=config["role"],
+        warehouse=config["warehouse"],
+        query_tag=os.getenv("SNOWFLAKE_QUERY_TAG", "support_case_analysis"),
+        health_check_interval=float(
+            os.getenv("SNOWFLAKE_SESSION_HEALTH_CHECK_INTERVAL", 60)
+        ),
+        checkout_timeout=float(
+            os.getenv("SNOWFLAKE_SESSION_CHECKOUT_TIMEOUT", 300)
+        ),
+    )
+
+
+@st.cache_resource
+def get_session_pool():
+    return create_session_pool()
+
+
+@st.cache_resource
+def get_search_root(_session_pool):
+    """A snowflake.core Root shared by every Cortex Search query in the process.
+
+    It runs on its own session rather than a pooled one: the handle is kept
+    for the life of the process, and its REST calls are safe to make from
+    several threads at once.
+    """
+    from snowflake.core import Root
+
+    return Root(_session_pool.factory())
+
+
+@st.cache_resource
+def get_search_service(_session_pool, name):
+    with _session_pool.session(query_tag="cortex_search_page") as session:
+        db, schema = session.get_current_database(), session.get_current_schema()
+    return (
+        get_search_root(_session_pool)
+        .databases[db]
+        .schemas[schema]
+        .cortex_search_services[name]
+    )
@@ -0,0 +1,209 @@
+"""Headless batch runs of process_cases.
+
+Usage, from scripts/streamlit:
+
+    python -m common.batch specs.json [--max-in-flight 8] [--workers 4]
+
+specs.json holds a list of run specs, for example:
+
+    [{"prefix": "BILLING", "categories": ["Payments and Billing"], "weeks": 12},
+     {"prefix": "ALL", "categories": ["Payments and Billing", "Shipping and Delivery"],
+      "weeks": 26, "model": "llama3-70b", "mode": "cluster"}]
+"""
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+from .chains import LogProgress
+from .process_cases import fetch_cases, process_cases
+
+
+@dataclass
+class RunSpec:
+    prefix: str
+    categories: List[str]
+    weeks: int = 12
+    model: str = "mistral-large"
+    mode: str = "map_reduce"
+    cortex_search: bool = False
+    dedup: bool = True
+    concurrency: int = 5
+    num_clusters: Optional[int] = None
+    cases_per_cluster: int = 5
+
+
+@dataclass
+class RunResult:
+    spec: RunSpec
+    elapsed: float = 0.0
+    total_tokens: int = 0
+    error: Optional[str] = None
+
+
+class CompleteLimiter:
+    """A semaphore on in-flight COMPLETE calls that also counts them."""
+
+    def __init__(self, max_in_flight):
+        self._semaphore = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def __enter__(self):
+        self._semaphore.acquire()
+        with self._lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        return self
+
+    def __exit__(self, *exc):
+        with self._lock:
+            self.in_flight -= 1
+        self._semaphore.release()
+
+
+@dataclass
+class BatchReport:
+    results: List[RunResult]
+    elapsed: float
+    complete_calls: int
+    peak_in_flight: int
+    cases_fetched: int = 0
+
+    def __str__(self):
+        total_tokens = sum(r.total_tokens for r in self.results)
+        failed = [r for r in self.results if r.error]
+        lines = [
+            f"{'PREFIX':<20} {'MODE':<10} {'WEEKS':>5} {'SECONDS':>8} {'TOKENS':>10}  STATUS"
+        ]
+        for r in self.results:
+            lines.append(
+                f"{r.spec.prefix:<20} {r.spec.mode:<10} {r.spec.weeks:>5} "
+                f"{r.elapsed:>8.1f} {r.total_tokens:>10}  {r.error or 'ok'}"
+            )
+        lines += [
+            "",
+            f"Runs: {len(self.results)} ({len(failed)} failed) in {self.elapsed:.1f}s",
+            f"Cases fetched: {self.cases_fetched}",
+            f"COMPLETE calls: {self.complete_calls} (peak in flight: {self.peak_in_flight})",
+            f"Tokens: {total_tokens} ({total_tokens / max(self.elapsed, 1e-9):.0f} tokens/s)",
+            f"Runs per minute: {60 * len(self.results) / max(self.elapsed, 1e-9):.1f}",
+        ]
+        return "\n".join(lines)
+
+
+def run_batch(
+    session_pool,
+    specs: List[RunSpec],
+    max_in_flight: int = 8,
+    workers: Optional[int] = None,
+    progress_factory: Callable = LogProgress,
+) -> BatchReport:
+    """Run specs concurrently, sharing one case fetch and one COMPLETE limit.
+
+    Every spec, weekly ones included, reads its window from the same
+    snapshot of SUPPORT_CASES.
+
+    LLM responses are shared through LangChain's process-wide cache, keyed
+    on the prompt and the model: a spec reuses the responses of another spec
+    with the same model once they have completed, and specs with different
+    models never share them. Identical prompts that are in flight at the
+    same time are each sent.
+    """
+    from .cortex_llm import DEBUG
+
+    start = time.perf_counter()
+    limiter = CompleteLimiter(max_in_flight)
+
+    # One fetch covering every category and the widest window; each run
+    # windows it locally.
+    snapshot = None
+    if specs:
+        categories = sorted({c for spec in specs for c in spec.categories})
+        with session_pool.session(query_tag="batch") as session:
+            snapshot = fetch_cases(
+                session,
+                categories,
+                max(spec.weeks for spec in specs),
+                embeddings=any(spec.mode == "cluster" for spec in specs) and not DEBUG,
+            )
+
+    def run(spec):
+        result = RunResult(spec)
+        run_start = time.perf_counter()
+        try:
+            result.total_tokens = process_cases(
+                session_pool,
+                spec.weeks,
+                spec.categories,
+                spec.prefix,
+                spec.cortex_search,
+                progress_factory(spec.prefix),
+                spec.concurrency,
+                model=spec.model,
+                dedup=spec.dedup,
+                mode=spec.mode,
+                num_clusters=spec.num_clusters,
+                cases_per_cluster=spec.cases_per_cluster,
+                cases=snapshot,
+                complete_limiter=limiter,
+            )
+        except Exception as e:
+            result.error = str(e)
+        result.elapsed = time.perf_counter() - run_start
+        return result
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers or len(specs) or 1) as executor:
+            results = list(executor.map(run, specs))
+    finally:
+        if snapshot is not None:
+            with session_pool.session(query_tag="batch") as session:
+                snapshot.drop(session)
+
+    return BatchReport(
+        results=results,
+        elapsed=time.perf_counter() - start,
+        complete_calls=limiter.calls,
+        peak_in_flight=limiter.peak_in_flight,
+        cases_fetched=len(snapshot.cases) if snapshot is not None else 0,
+    )
+
+
+def load_specs(path) -> List[RunSpec]:
+    with open(path) as f:
+        return [RunSpec(**spec) for spec in json.load(f)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run process_cases for many specs.")
+    parser.add_argument("specs", help="JSON file with a list of run specs")
+    parser.add_argument("--max-in-flight", type=int, default=8, help="Global cap on concurrent COMPLETE calls")
+    parser.add_argument("--workers", type=int, default=None, help="Runs to execute at once (default: all)")
+    args = parser.parse_args(argv)
+
+    from .app_tools import create_session_pool
+
+    # Enough sessions for every allowed COMPLETE call plus the data queries.
+    session_pool = create_session_pool(size=args.max_in_flight + 2)
+    try:
+        report = run_batch(
+            session_pool,
+            load_specs(args.specs),
+            max_in_flight=args.max_in_flight,
+            workers=args.workers,
+        )
+    finally:
+        session_pool.close()
+    print(report)
+    return 1 if any(r.error for r in report.results) else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
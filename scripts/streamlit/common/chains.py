@@ -0,0 +1,190 @@
+import os
+import threading
+from queue import Empty, Queue
+from typing import Callable, List
+
+from .startup import TIKTOKEN_CACHE_DIR, ENCODING_NAME
+
+MAP_PROMPT = """
+                                                Given the following support cases for an order, return a summary of each case.
+                                                Include details on the category of the issue, the errors or symptoms the customer noticed,
+                                                and any basic details about what the customer was looking to accomplish.
+                                                If multiple cases exist in the same category, you can group them together.
+                                                A case with a SIMILAR CASES line stands for that many near-identical cases, so weigh it accordingly.
+                                                A CLUSTER SIZE line means the cases after it are samples of a topic with that many cases.
+                                                The summary will be used to understand overall case trends and causes that the team can 
+                                                use to prioritize fixes and improvements.
+                                                    
+                                                ### Cases ###
+                                                
+                                                {cases}
+                                                    """
+
+REDUCE_PROMPT = """
+                                                    Given the following set of summaries for support case reports opened for an order , 
+                                                    distill it into a final, consolidated and detailed summary of trends and top pain points or blockers customers have been hitting.
+                                                    Prioritize issue categories that show up in multiple summaries as they are likely to be the most impactful.
+                                                    Include a description of the issue, the symptoms the customer noticed, what they were trying to do, and what led them to open the case.
+                                                
+                                                    ### Case Chunk Summaries ###
+                                                
+                                                    {summaries} 
+                                                """
+
+_llm_cache_lock = threading.Lock()
+_llm_cache_installed = False
+
+
+def ensure_llm_cache():
+    # Installed on first run rather than at import so that importing this
+    # module stays cheap and free of side effects.
+    global _llm_cache_installed
+    with _llm_cache_lock:
+        if _llm_cache_installed:
+            return
+        from langchain.cache import InMemoryCache
+        from langchain.globals import set_llm_cache
+
+        set_llm_cache(InMemoryCache())
+        _llm_cache_installed = True
+
+
+def make_llm(session_pool, model, concurrency, complete_limiter=None):
+    from .cortex_llm import CortexLLM
+
+    ensure_llm_cache()
+    return CortexLLM(
+        model=model,
+        max_retries=2,
+        retry_delay=0,
+        session_pool=session_pool,
+        concurrency=concurrency,
+        complete_limiter=complete_limiter,
+    )
+
+
+def split_cases(case_strings: List[str]):
+    """Chunk case strings into documents of at most 20k tokens."""
+    from langchain_text_splitters import CharacterTextSplitter
+
+    os.environ.setdefault("TIKTOKEN_CACHE_DIR", TIKTOKEN_CACHE_DIR)
+    text_splitter = CharacterTextSplitter().from_tiktoken_encoder(
+        ENCODING_NAME,
+        separator="#####",
+        chunk_size=20000,
+        chunk_overlap=4000,
+        is_separator_regex=False,
+    )
+    # Convert the case strings to a single appended string
+    return text_splitter.create_documents([" ".join(case_strings)])
+
+
+def map_chain(llm, handler):
+    from langchain.chains import LLMChain
+    from langchain_core.prompts import PromptTemplate
+
+    return LLMChain(
+        llm=llm, prompt=PromptTemplate.from_template(MAP_PROMPT), callbacks=[handler]
+    )
+
+
+def reduce_documents_chain(llm, handler):
+    from langchain.chains import LLMChain, ReduceDocumentsChain, StuffDocumentsChain
+    from langchain_core.prompts import PromptTemplate
+
+    reduce_chain = LLMChain(
+        llm=llm, prompt=PromptTemplate.from_template(REDUCE_PROMPT), callbacks=[handler]
+    )
+
+    combine_docs_chain = StuffDocumentsChain(
+        llm_chain=reduce_chain, document_variable_name="summaries"
+    )
+
+    return ReduceDocumentsChain(
+        combine_documents_chain=combine_docs_chain,
+        collapse_documents_chain=combine_docs_chain,
+        token_max=28000,
+    )
+
+
+def map_reduce_documents_chain(llm, handler):
+    from langchain.chains import MapReduceDocumentsChain
+
+    return MapReduceDocumentsChain(
+        llm_chain=map_chain(llm, handler),
+        reduce_documents_chain=reduce_documents_chain(llm, handler),
+        document_variable_name="cases",
+        return_intermediate_steps=True,
+    )
+
+
+class NullProgress:
+    """Progress sink that discards updates; st.progress's interface."""
+
+    def progress(self, value, text=None):
+        pass
+
+    def empty(self):
+        pass
+
+
+class LogProgress(NullProgress):
+    """Progress sink that prints each new status line, for headless runs."""
+
+    def __init__(self, name):
+        self.name = name
+        self.last_text = None
+
+    def progress(self, value, text=None):
+        if text != self.last_text:
+            print(f"[{self.name}] {value:.0%} {text or ''}")
+            self.last_text = text
+
+
+def run_with_progress(task: Callable, total: int, progress_bar):
+    """Run task(handler) in a background thread while driving progress_bar.
+
+    total is the number of map calls; the handler counts two more for the
+    reduce step.
+    """
+    from .cortex_llm import ProgressCallback
+
+    progress_queue = Queue()
+    result_queue = Queue()
+    handler = ProgressCallback(total, progress_queue)
+
+    def background_task():
+        try:
+            result_queue.put(("result", task(handler)))
+        except Exception as e:
+            result_queue.put(("error", e))
+
+    thread = threading.Thread(target=background_task)
+
+    thread.start()
+
+    # Main Streamlit loop to handle progress updates
+    while thread.is_alive() or not progress_queue.empty() or not result_queue.empty():
+        try:
+            update = progress_queue.get(timeout=1)
+            if update[0] == "update":
+                finished, total = update[2], update[3]
+                if finished >= total - 2:
+                    text = "Summarizing chunks...."
+                else:
+                    text = f"Processing cases... (Chunks finished: {finished} | Total chunks: {total - 2})"
+                progress_value = min(finished / total, 0.95)
+                progress_bar.progress(progress_value, text=text)
+        except Empty:
+            pass
+        try:
+            status, result = result_queue.get_nowait()
+            break
+        except Empty:
+            pass
+
+    # Ensure thread has finished
+    thread.join()
+    if status == "error":
+        raise result
+    return result
@@ -0,0 +1,130 @@
+import json
+import math
+import re
+import zlib
+from dataclasses import dataclass
+from typing import List, Sequence
+
+import numpy as np
+
+EMBED_MODEL = "snowflake-arctic-embed-m"
+_WORD = re.compile(r"\w+")
+
+
+@dataclass
+class Cluster:
+    cluster: int
+    size: int
+    representatives: List[int]
+    members: List[int]
+
+
+def parse_embeddings(values: Sequence) -> np.ndarray:
+    """Stack EMBED_TEXT results, which arrive as JSON strings or lists."""
+    rows = [json.loads(v) if isinstance(v, str) else v for v in values]
+    return normalize(np.asarray(rows, dtype=np.float32))
+
+
+def local_embeddings(texts: Sequence[str], dim: int = 1024) -> np.ndarray:
+    """Signed hashing-trick vectors over words and word bigrams.
+
+    Stands in for Cortex EMBED_TEXT when running offline (DEBUG).
+    """
+    X = np.zeros((len(texts), dim), dtype=np.float32)
+    for i, text in enumerate(texts):
+        words = _WORD.findall(text.lower())
+        for feature in words + [a + " " + b for a, b in zip(words, words[1:])]:
+            h = zlib.crc32(feature.encode())
+            X[i, h % dim] += 1.0 if h & (1 << 31) else -1.0
+    return normalize(X)
+
+
+def normalize(X: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(X, axis=1, keepdims=True)
+    return X / np.where(norms == 0, 1, norms)
+
+
+def default_num_clusters(num_cases: int, max_clusters: int = 30) -> int:
+    return max(1, min(max_clusters, math.ceil(math.sqrt(num_cases / 2))))
+
+
+def mini_batch_kmeans(
+    X: np.ndarray,
+    k: int,
+    batch_size: int = 256,
+    iterations: int = 100,
+    seed: int = 0,
+):
+    """Mini-batch k-means (Sculley, 2010). Returns (centroids, labels)."""
+    rng = np.random.default_rng(seed)
+    n = X.shape[0]
+    k = min(k, n)
+    centroids = X[rng.choice(n, size=k, replace=False)].copy()
+    counts = np.zeros(k)
+
+    for _ in range(iterations):
+        batch = X[rng.choice(n, size=min(batch_size, n), replace=False)]
+        nearest = _nearest(batch, centroids)
+        # Per-centroid learning rate 1 / count, applied to the batch mean.
+        batch_counts = np.bincount(nearest, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, nearest, batch)
+        seen = batch_counts > 0
+        counts[seen] += batch_counts[seen]
+        rate = (batch_counts[seen] / counts[seen])[:, None]
+        centroids[seen] += rate * (sums[seen] / batch_counts[seen][:, None] - centroids[seen])
+
+    return centroids, _nearest(X, centroids)
+
+
+def _nearest(X: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    distances = (
+        (X * X).sum(axis=1)[:, None]
+        - 2 * X @ centroids.T
+        + (centroids * centroids).sum(axis=1)[None, :]
+    )
+    return distances.argmin(axis=1)
+
+
+def cluster_cases(
+    X: np.ndarray, num_clusters: int = None, cases_per_cluster: int = 5, seed: int = 0
+) -> List[Cluster]:
+    """Cluster case embeddings and pick the cases closest to each centroid.
+
+    Clusters are returned largest first; empty clusters are dropped.
+    """
+    num_clusters = num_clusters or default_num_clusters(len(X))
+    centroids, labels = mini_batch_kmeans(X, num_clusters, seed=seed)
+    distances = ((X - centroids[labels]) ** 2).sum(axis=1)
+
+    clusters = []
+    for c in range(len(centroids)):
+        members = np.flatnonzero(labels == c)
+        if len(members) == 0:
+            continue
+        closest = members[np.argsort(distances[members])[:cases_per_cluster]]
+        clusters.append(
+            Cluster(
+                cluster=c,
+                size=len(members),
+                representatives=closest.tolist(),
+                members=members.tolist(),
+            )
+        )
+    clusters.sort(key=lambda cluster: cluster.size, reverse=True)
+    return clusters
+
+
+def cluster_case_strings(case_strings: Sequence[str], clusters: List[Cluster]) -> List[str]:
+    """One block per cluster holding its representatives and the cluster size."""
+    blocks = []
+    for cluster in clusters:
+        cases = "\n\n".join(
+            case_strings[i].replace("#####", "", 1).strip()
+            for i in cluster.representatives
+        )
+        blocks.append(
+            f"##### \nCLUSTER SIZE: {cluster.size} cases "
+            f"({len(cluster.representatives)} representative cases shown)\n\n{cases}"
+        )
+    return blocks
@@ -2,17 +2,18 @@ import os
 from langchain_core.language_models.llms import LLM
 from typing import Any, Dict, List, Optional
 from langchain_core.callbacks.manager import CallbackManagerForLLMRun
-from snowflake.snowpark.session import Session
+from .session_pool import SessionPool
 from langchain_core.callbacks import BaseCallbackHandler
 from langchain.schema.output import LLMResult, Generation
 
 import json
 import time
+from contextlib import nullcontext
 
 
 from queue import Queue
 
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
 
 DEBUG = os.getenv("DEBUG", False)
 
@@ -38,12 +39,14 @@ class ProgressCallback(BaseCallbackHandler):
 
 
 class CortexLLM(LLM):
-    session: Session
+    session_pool: SessionPool
     max_retries = 3
     retry_delay = 10
     model = "reka-core"
     total: int = 0
     concurrency: int = 2
+    # Optional semaphore shared between LLMs to cap in-flight COMPLETE calls.
+    complete_limiter: Optional[Any] = None
 
     def _generate(
         self,
@@ -54,15 +57,18 @@ class CortexLLM(LLM):
     ) -> LLMResult:
         generations = []
 
+        # Every worker holds a pooled session while COMPLETE runs, so more
+        # workers than sessions would only wait on checkout.
         with ThreadPoolExecutor(
-            max_workers=self.concurrency
+            max_workers=min(self.concurrency, self.session_pool.size)
         ) as executor:  # Limiting ThreadPoolExecutor based on concurrency
             futures = []
             for prompt in prompts:
                 future = executor.submit(self._call, prompt, run_manager)
                 futures.append(future)
 
-            for future in as_completed(futures):
+            # Keep generations in prompt order so callers can match them up.
+            for future in futures:
                 response = future.result()
                 generations.append([Generation(text=response)])
 
@@ -81,28 +87,30 @@ class CortexLLM(LLM):
             json_response = None  # Initialize json_response variable
             try:
                 if DEBUG:
-                    time.sleep(2)
+                    with self._limit():
+                        time.sleep(2)
                     return "test"
-                job = self.session.sql(
-                    """
-                    SELECT SNOWFLAKE.CORTEX.COMPLETE(
-                        :1,
-                        [
-                            {'role': 'system', 'content': 'You are a helpful AI assistant. 
-                                       You are tasked to help summarize and detect trends based 
-                                       on the support cases provided. Only generate insights based on the content provided by the user.' },
-                            {'role': 'user', 'content': :2}
-                        ],
-                        {
-                            'max_tokens': 8000,
-                            'temperature': 0.7
-                        }
-                    )
-                    """,
-                    (model, prompt),
-                ).collect_nowait()
-                query_id = job.query_id
-                response = job.result()
+                with self._limit(), self.session_pool.session(query_tag="cortex_llm") as session:
+                    job = session.sql(
+                        """
+                        SELECT SNOWFLAKE.CORTEX.COMPLETE(
+                            :1,
+                            [
+                                {'role': 'system', 'content': 'You are a helpful AI assistant. 
+                                           You are tasked to help summarize and detect trends based 
+                                           on the support cases provided. Only generate insights based on the content provided by the user.' },
+                                {'role': 'user', 'content': :2}
+                            ],
+                            {
+                                'max_tokens': 8000,
+                                'temperature': 0.7
+                            }
+                        )
+                        """,
+                        (model, prompt),
+                    ).collect_nowait()
+                    query_id = job.query_id
+                    response = job.result()
                 if len(response) > 0:
                     json_response = json.loads(response[0][0])
                     message = json_response["choices"][0].get("messages", "")
@@ -133,11 +141,17 @@ class CortexLLM(LLM):
                 retries += 1
         return ""
 
+    def _limit(self):
+        return self.complete_limiter or nullcontext()
+
     @property
     def _identifying_params(self) -> Dict[str, Any]:
         """Return a dictionary of identifying parameters."""
+        # Part of LangChain's cache key, so responses are only reused for
+        # the model that produced them.
         return {
             "model_name": "CustomCortexModel",
+            "model": self.model,
         }
 
     @property
@@ -0,0 +1,154 @@
+import re
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+_PRIME = np.uint64((1 << 31) - 1)
+_WORD = re.compile(r"\w+")
+
+
+@dataclass
+class CaseGroup:
+    representative: int
+    members: List[int] = field(default_factory=list)
+
+    @property
+    def count(self) -> int:
+        return len(self.members)
+
+
+@dataclass
+class DedupResult:
+    groups: List[CaseGroup]
+    case_ids: Dict[int, List[str]]
+    tokens_before: int = 0
+    tokens_after: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+    def report(self) -> str:
+        cases = sum(group.count for group in self.groups)
+        saved_pct = 100 * self.tokens_saved / self.tokens_before if self.tokens_before else 0
+        return (
+            f"Collapsed {cases} cases into {len(self.groups)} groups, "
+            f"{self.tokens_before} -> {self.tokens_after} tokens ({saved_pct:.0f}% saved)"
+        )
+
+
+def _shingles(text: str, size: int) -> np.ndarray:
+    words = _WORD.findall(text.lower())
+    if len(words) < size:
+        words = words or [text]
+        size = len(words)
+    shingles = {" ".join(words[i : i + size]) for i in range(len(words) - size + 1)}
+    return np.fromiter(
+        (zlib.crc32(s.encode()) for s in shingles), dtype=np.uint64, count=len(shingles)
+    ) % _PRIME
+
+
+class MinHashDeduplicator:
+    """Groups near-duplicate texts with MinHash signatures and LSH banding.
+
+    Only group representatives are indexed, and each text is compared against
+    at most ``max_candidates`` of them, so a run is linear in the number of
+    texts. Texts only group with others that share the same ``partition``.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.35,
+        shingle_size: int = 2,
+        num_perm: int = 126,
+        band_size: int = 3,
+        max_candidates: int = 8,
+        seed: int = 1,
+    ):
+        if num_perm % band_size:
+            raise ValueError("num_perm must be a multiple of band_size.")
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.num_perm = num_perm
+        self.band_size = band_size
+        self.max_candidates = max_candidates
+        rng = np.random.default_rng(seed)
+        # Universal hashes (a * h + b) mod p over a prime below 2**31, so the
+        # product stays well inside uint64 and the modulus actually mixes.
+        self._a = rng.integers(1, _PRIME, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = _shingles(text, self.shingle_size)
+        return ((np.outer(self._a, hashes) + self._b[:, None]) % _PRIME).min(axis=1)
+
+    def group(self, texts: Sequence[str], partitions: Sequence = None) -> List[CaseGroup]:
+        partitions = partitions if partitions is not None else [None] * len(texts)
+        buckets = defaultdict(list)
+        signatures = {}
+        groups: Dict[int, CaseGroup] = {}
+
+        for i, (text, partition) in enumerate(zip(texts, partitions)):
+            sig = self.signature(text)
+            bands = [
+                (partition, b, sig[b * self.band_size : (b + 1) * self.band_size].tobytes())
+                for b in range(self.num_perm // self.band_size)
+            ]
+
+            hits = defaultdict(int)
+            for band in bands:
+                for rep in buckets.get(band, ()):
+                    hits[rep] += 1
+            best, best_similarity = None, self.threshold
+            for rep in sorted(hits, key=hits.get, reverse=True)[: self.max_candidates]:
+                similarity = float(np.mean(signatures[rep] == sig))
+                if similarity >= best_similarity:
+                    best, best_similarity = rep, similarity
+
+            if best is not None:
+                groups[best].members.append(i)
+                continue
+            signatures[i] = sig
+            groups[i] = CaseGroup(representative=i, members=[i])
+            for band in bands:
+                buckets[band].append(i)
+
+        return list(groups.values())
+
+
+def collapse_cases(pandas_df, count_tokens=None, **kwargs) -> DedupResult:
+    """Collapse near-duplicate cases on CASE_TITLE + CASE_DESCRIPTION.
+
+    Expects CASE_ID, CATEGORY, CASE_TITLE, CASE_DESCRIPTION and CASE_STRING
+    columns; duplicates are only grouped within the same category.
+    """
+    texts = (
+        pandas_df["CASE_TITLE"].astype(str) + " " + pandas_df["CASE_DESCRIPTION"].astype(str)
+    ).tolist()
+    groups = MinHashDeduplicator(**kwargs).group(texts, pandas_df["CATEGORY"].tolist())
+    case_ids = pandas_df["CASE_ID"].astype(str).tolist()
+    result = DedupResult(
+        groups=groups,
+        case_ids={g.representative: [case_ids[i] for i in g.members] for g in groups},
+    )
+    if count_tokens is not None:
+        result.tokens_before = sum(count_tokens(s) for s in pandas_df["CASE_STRING"])
+        result.tokens_after = sum(
+            count_tokens(s) for s in group_case_strings(pandas_df, result)
+        )
+    return result
+
+
+def group_case_strings(pandas_df, result: DedupResult) -> List[str]:
+    """One CASE_STRING per group, annotated with how many cases it stands for."""
+    case_strings = pandas_df["CASE_STRING"].astype(str).tolist()
+    strings = []
+    for group in result.groups:
+        case_string = case_strings[group.representative]
+        if group.count > 1:
+            case_string += f"\n\nSIMILAR CASES: {group.count} near-identical cases"
+        strings.append(case_string)
+    return strings
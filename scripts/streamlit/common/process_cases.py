@@ -1,19 +1,6 @@
-import threading
-from snowflake.snowpark.functions import concat, lit, col, max
-from langchain_text_splitters import CharacterTextSplitter
-import tiktoken
+from snowflake.snowpark.functions import concat, lit, col, max, call_function, dateadd
 import os
-from .cortex_llm import CortexLLM, ProgressCallback
-from langchain.chains import (
-    StuffDocumentsChain,
-    MapReduceDocumentsChain,
-    ReduceDocumentsChain,
-    LLMChain,
-)
-
-from langchain_core.prompts import PromptTemplate
-from langchain.cache import InMemoryCache
-from langchain.globals import set_llm_cache
+import uuid
 from snowflake.snowpark.types import (
     StructType,
     StructField,
@@ -23,180 +10,299 @@ from snowflake.snowpark.types import (
     VariantType,
 )
 
-from queue import Empty, Queue
-
 from datetime import datetime, timedelta
 
-set_llm_cache(InMemoryCache())
+from .startup import get_encoding
+from .chains import make_llm, map_reduce_documents_chain, run_with_progress, split_cases
+from .dedup import collapse_cases, group_case_strings
+from .clustering import (
+    EMBED_MODEL,
+    cluster_case_strings,
+    cluster_cases,
+    local_embeddings,
+    parse_embeddings,
+)
+from .query_cache import query_cache, SUMMARY_TABLES, CORTEX_SEARCH_SERVICES
 
 
-def process_cases(
-    session,
-    weeks_back,
-    categories,
-    prefix,
-    cortex_search,
-    progress_bar,
-    concurrency,
-    model="mistral-large",
-):
-    session = session
-    latest_case_date = session.table("SUPPORT_CASES").select(max(col("DATE_CREATED"))).collect()[0][0]
-
-    support_tickets = session.table("SUPPORT_CASES").filter(col("CATEGORY").isin(categories)).filter(col("DATE_CREATED") > latest_case_date - timedelta(weeks=weeks_back))
-       
-
-    cases_df = support_tickets.select(
-        concat(
-            lit("##### \nCASE TITLE: "),
-            col("CASE_TITLE"),
-            lit("\n\nCASE DESCRIPTION: "),
-            col("CASE_DESCRIPTION"),
-            lit("\n\nCASE STATUS: "),
-            col("STATUS"),
-            lit("\n\nLAST COMMENT: "),
-            col("LAST_UPDATE"),
-        ).alias("CASE_STRING")
-    )
+class CaseSnapshot:
+    """One filtered read of SUPPORT_CASES, materialized with its case strings.
 
-    # num_tokens = cases_df.select(
-    #     F.array_size(F.split(col("CASE_STRING"), lit(" "))).alias("num_tokens")
-    # )
-    # num_tokens.agg(F.sum(col("num_tokens")).alias("total_words")).show()
-
-    pandas_df = cases_df.to_pandas()
-    if pandas_df.empty:
-        raise ValueError("No data found for the given filters.")
-
-    # Convert the Pandas DataFrame to a single appended string
-    appended_string = pandas_df.apply(
-        lambda x: " ".join(x.astype(str)), axis=1
-    ).str.cat(sep=" ")
-
-    def num_tokens_from_string(string: str) -> int:
-        encoding = tiktoken.get_encoding("cl100k_base")
-        num_tokens = len(encoding.encode(string))
-        return num_tokens
-
-    text_splitter = CharacterTextSplitter().from_tiktoken_encoder(
-        "cl100k_base",
-        separator="#####",
-        chunk_size=20000,
-        chunk_overlap=4000,
-        is_separator_regex=False,
-    )
-    texts = text_splitter.create_documents([appended_string])
-
-    map_template = PromptTemplate.from_template(
-        """
-                                                Given the following support cases for an order, return a summary of each case.
-                                                Include details on the category of the issue, the errors or symptoms the customer noticed,
-                                                and any basic details about what the customer was looking to accomplish.
-                                                If multiple cases exist in the same category, you can group them together.
-                                                The summary will be used to understand overall case trends and causes that the team can 
-                                                use to prioritize fixes and improvements.
-                                                    
-                                                ### Cases ###
-                                                
-                                                {cases}
-                                                    """
-    )
+    The snapshot lives in a transient table rather than a session-scoped temp
+    table so that every pooled session (and every run of a batch) can read
+    it. The summary, token counts and search index are all derived from it,
+    so they always describe the same cases.
+    """
 
-    reduce_template = PromptTemplate.from_template(
-        """
-                                                    Given the following set of summaries for support case reports opened for an order , 
-                                                    distill it into a final, consolidated and detailed summary of trends and top pain points or blockers customers have been hitting.
-                                                    Prioritize issue categories that show up in multiple summaries as they are likely to be the most impactful.
-                                                    Include a description of the issue, the symptoms the customer noticed, what they were trying to do, and what led them to open the case.
-                                                
-                                                    ### Case Chunk Summaries ###
-                                                
-                                                    {summaries} 
-                                                """
-    )
+    def __init__(self, table_name, source_columns, cases):
+        self.table_name = table_name
+        self.source_columns = source_columns
+        self.cases = cases
+        self.latest_case_date = (
+            cases["LATEST_CASE_DATE"].iloc[0] if not cases.empty else None
+        )
 
-    llm = CortexLLM(
-        model=model,
-        max_retries=2,
-        retry_delay=0,
-        session=session,
-        concurrency=concurrency,
-    )
+    def window(self, categories, weeks_back):
+        cases = self.cases
+        if cases.empty:
+            return cases
+        start = self.latest_case_date - timedelta(weeks=weeks_back)
+        return cases[
+            cases["CATEGORY"].isin(categories) & (cases["DATE_CREATED"] > start)
+        ].reset_index(drop=True)
+
+    def index_table(self, session, categories, weeks_back):
+        """The snapshot's cases in SUPPORT_CASES' shape plus INDEX_TEXT."""
+        snapshot = session.table(self.table_name)
+        return (
+            snapshot.filter(col("CATEGORY").isin(categories))
+            .filter(col("DATE_CREATED") > dateadd("week", lit(-weeks_back), col("LATEST_CASE_DATE")))
+            .select(*[col(c) for c in self.source_columns], col("CASE_STRING").alias("INDEX_TEXT"))
+        )
 
-    progress_queue = Queue()
-    result_queue = Queue()
+    def drop(self, session):
+        session.sql(f"DROP TABLE IF EXISTS {self.table_name}").collect()
 
-    def background_task(chain, texts, handler, result_queue):
-        result = chain.invoke(texts, {"callbacks": [handler]})
-        result_queue.put(result)
 
-    handler = ProgressCallback(len(texts), progress_queue)
-    map_chain = LLMChain(llm=llm, prompt=map_template, callbacks=[handler])
-    reduce_chain = LLMChain(llm=llm, prompt=reduce_template, callbacks=[handler])
+SNAPSHOT_PREFIX = "SUPPORT_CASES_SNAPSHOT_"
 
-    combine_docs_chain = StuffDocumentsChain(
-        llm_chain=reduce_chain, document_variable_name="summaries"
-    )
 
-    reduce_documents_chain = ReduceDocumentsChain(
-        combine_documents_chain=combine_docs_chain,
-        collapse_documents_chain=combine_docs_chain,
-        token_max=28000,
+def drop_stale_snapshots(session, max_age_hours=24):
+    """Drop snapshot tables left behind by runs that crashed or were killed."""
+    try:
+        stale = session.sql(
+            """
+            SELECT TABLE_NAME FROM INFORMATION_SCHEMA.TABLES
+            WHERE TABLE_SCHEMA = CURRENT_SCHEMA()
+              AND STARTSWITH(TABLE_NAME, :1)
+              AND CREATED < DATEADD('hour', :2, CURRENT_TIMESTAMP())
+            """,
+            (SNAPSHOT_PREFIX, -max_age_hours),
+        ).collect()
+        for row in stale:
+            session.sql(f"DROP TABLE IF EXISTS {row[0]}").collect()
+    except Exception as e:
+        print(f"Dropping stale case snapshots failed: {str(e)}")
+
+
+def case_string_expr():
+    """The text each case is summarized and indexed by."""
+    return concat(
+        lit("##### \nCASE TITLE: "),
+        col("CASE_TITLE"),
+        lit("\n\nCASE DESCRIPTION: "),
+        col("CASE_DESCRIPTION"),
+        lit("\n\nCASE STATUS: "),
+        col("STATUS"),
+        lit("\n\nLAST COMMENT: "),
+        col("LAST_UPDATE"),
     )
 
-    map_reduce_chain = MapReduceDocumentsChain(
-        llm_chain=map_chain,
-        reduce_documents_chain=reduce_documents_chain,
-        document_variable_name="cases",
-        return_intermediate_steps=True,
-    )
 
-    progress_bar.progress(0, text=f"Processing cases... (Total Chunks: {len(texts)})")
-    thread = threading.Thread(
-        target=background_task, args=(map_reduce_chain, texts, handler, result_queue)
+def fetch_cases(session, categories, weeks_back, embeddings=False):
+    """Materialize the window of cases in a single scan of SUPPORT_CASES.
+
+    The window bound is computed in the same statement as the filter, from the
+    latest case date across all categories.
+    """
+    support_cases = session.table("SUPPORT_CASES")
+    cases_df = (
+        support_cases.with_column("LATEST_CASE_DATE", max(col("DATE_CREATED")).over())
+        .filter(col("CATEGORY").isin(categories))
+        .filter(col("DATE_CREATED") > dateadd("week", lit(-weeks_back), col("LATEST_CASE_DATE")))
+        .with_column("CASE_STRING", case_string_expr())
     )
+    if embeddings:
+        cases_df = cases_df.with_column(
+            "EMBEDDING",
+            call_function(
+                "SNOWFLAKE.CORTEX.EMBED_TEXT_768",
+                lit(EMBED_MODEL),
+                concat(col("CASE_TITLE"), lit(" "), col("CASE_DESCRIPTION")),
+            ),
+        )
 
-    thread.start()
-
-    # Main Streamlit loop to handle progress updates
-    while thread.is_alive() or not progress_queue.empty() or not result_queue.empty():
-        try:
-            task = progress_queue.get(timeout=1)
-            if task[0] == "update":
-                finished, total = task[2], task[3]
-                if finished >= total - 2:
-                    text = "Summarizing chunks...."
-                else:
-                    text = f"Processing cases... (Chunks finished: {finished} | Total chunks: {total - 2})"
-                progress_value = min(finished / total, 0.95)
-                # print(
-                #     "progress_value, start, finish, total: ",
-                #     progress_value,
-                #     task[1],
-                #     task[2],
-                #     task[3],
-                # )
-                progress_bar.progress(progress_value, text=text)
-        except Empty:
-            pass
-        try:
-            result = result_queue.get_nowait()
-            break
-        except Empty:
-            pass
-
-    # Ensure thread has finished
-    thread.join()
-
-    schema = StructType(
-        [
-            StructField("datetime", TimestampType()),
-            StructField("day", DateType()),
-            StructField("output_text", StringType()),
-            StructField("intermediate_steps", VariantType()),
-        ]
+    drop_stale_snapshots(session)
+    table_name = f"{SNAPSHOT_PREFIX}{uuid.uuid4().hex[:12].upper()}"
+    cases_df.write.save_as_table(table_name, mode="overwrite", table_type="transient")
+    # Nothing to recover once a snapshot is dropped, so skip Time Travel.
+    session.sql(f"ALTER TABLE {table_name} SET DATA_RETENTION_TIME_IN_DAYS = 0").collect()
+    return CaseSnapshot(
+        table_name, support_cases.columns, session.table(table_name).to_pandas()
     )
 
+
+def process_cases(
+    session_pool,
+    weeks_back,
+    categories,
+    prefix,
+    cortex_search,
+    progress_bar,
+    concurrency,
+    model="mistral-large",
+    dedup=True,
+    mode="map_reduce",
+    num_clusters=None,
+    cases_per_cluster=5,
+    cases=None,
+    complete_limiter=None,
+):
+    """Summarize the selected cases and append the result to {prefix}_SUMMARIES.
+
+    mode="map_reduce" maps every case (after near-duplicate collapsing when
+    dedup is set). mode="cluster" embeds the cases, clusters them and maps
+    only cases_per_cluster representatives per cluster, so LLM cost scales
+    with the number of topics rather than the number of cases. mode="weekly"
+    keeps map summaries per (category, week) in {prefix}_WEEKLY_BUCKETS,
+    re-maps only buckets whose cases changed and reduces the stored ones.
+
+    cases is an optional CaseSnapshot covering these categories and weeks,
+    and complete_limiter an optional semaphore capping in-flight COMPLETE
+    calls; both let batch runs share work (see common.batch).
+    """
+    from .cortex_llm import DEBUG
+
+    if mode not in ("map_reduce", "cluster", "weekly"):
+        raise ValueError(f"Unknown mode: {mode}")
+
+    llm = make_llm(session_pool, model, concurrency, complete_limiter)
+
+    snapshot = cases
+    if snapshot is None:
+        with session_pool.session(query_tag="process_cases") as session:
+            snapshot = fetch_cases(
+                session, categories, weeks_back, embeddings=mode == "cluster" and not DEBUG
+            )
+    try:
+        if mode == "weekly":
+            from .weekly_buckets import summarize_window
+
+            if snapshot.latest_case_date is None:
+                raise ValueError("No data found for the given filters.")
+
+            # The snapshot starts before the window's first Monday, so bucket
+            # fingerprints and re-mapped cases are read from it rather than
+            # from SUPPORT_CASES.
+            result = summarize_window(
+                session_pool,
+                llm,
+                prefix,
+                categories,
+                snapshot.latest_case_date,
+                weeks_back,
+                model,
+                progress_bar,
+                dedup,
+                snapshot.table_name,
+            )
+            return _save_results(
+                session_pool, llm, prefix, result, cortex_search, snapshot, categories, weeks_back
+            )
+
+        pandas_df = snapshot.window(categories, weeks_back)
+
+        if pandas_df.empty:
+            raise ValueError("No data found for the given filters.")
+
+        clusters = dedup_result = None
+        if mode == "cluster":
+            if "EMBEDDING" in pandas_df:
+                embeddings = parse_embeddings(pandas_df["EMBEDDING"])
+            else:
+                embeddings = local_embeddings(
+                    (pandas_df["CASE_TITLE"].astype(str) + " " + pandas_df["CASE_DESCRIPTION"].astype(str)).tolist()
+                )
+            clusters = cluster_cases(embeddings, num_clusters, cases_per_cluster)
+            case_strings = cluster_case_strings(
+                pandas_df["CASE_STRING"].astype(str).tolist(), clusters
+            )
+            report = f"Clustered {len(pandas_df)} cases into {len(clusters)} topics"
+            print(report)
+            progress_bar.progress(0, text=report)
+        elif dedup:
+            # Send one representative per group of near-identical cases to the map step.
+            encoding = get_encoding()
+            dedup_result = collapse_cases(
+                pandas_df, count_tokens=lambda s: len(encoding.encode(s))
+            )
+            print(dedup_result.report())
+            progress_bar.progress(0, text=dedup_result.report())
+            case_strings = group_case_strings(pandas_df, dedup_result)
+        else:
+            case_strings = pandas_df["CASE_STRING"].astype(str).tolist()
+
+        texts = split_cases(case_strings)
+
+        progress_bar.progress(0, text=f"Processing cases... (Total Chunks: {len(texts)})")
+        result = run_with_progress(
+            lambda handler: map_reduce_documents_chain(llm, handler).invoke(
+                texts, {"callbacks": [handler]}
+            ),
+            len(texts),
+            progress_bar,
+        )
+
+        clusters_column = None
+        if clusters is not None:
+            case_ids = pandas_df["CASE_ID"].astype(str).tolist()
+            clusters_column = [
+                {
+                    "size": cluster.size,
+                    "representative_case_ids": [case_ids[i] for i in cluster.representatives],
+                    "case_ids": [case_ids[i] for i in cluster.members],
+                }
+                for cluster in clusters
+            ]
+        dedup_groups_column = None
+        if dedup_result is not None:
+            dedup_groups_column = [
+                {
+                    "size": len(ids),
+                    "representative_case_id": ids[0],
+                    "case_ids": ids,
+                }
+                for ids in dedup_result.case_ids.values()
+                if len(ids) > 1
+            ]
+        return _save_results(
+            session_pool,
+            llm,
+            prefix,
+            result,
+            cortex_search,
+            snapshot,
+            categories,
+            weeks_back,
+            clusters_column,
+            dedup_groups_column,
+        )
+    finally:
+        # Drop the snapshot this call created; a caller-supplied one is theirs to drop.
+        if cases is None and snapshot is not None:
+            with session_pool.session(query_tag="process_cases") as session:
+                snapshot.drop(session)
+
+
+def _save_results(
+    session_pool,
+    llm,
+    prefix,
+    result,
+    cortex_search,
+    snapshot,
+    categories,
+    weeks_back,
+    clusters=None,
+    dedup_groups=None,
+):
+    fields = [
+        StructField("datetime", TimestampType()),
+        StructField("day", DateType()),
+        StructField("output_text", StringType()),
+        StructField("intermediate_steps", VariantType()),
+    ]
+
     current_datetime = datetime.now()
     current_date = current_datetime.date()
 
@@ -208,36 +314,40 @@ def process_cases(
             result["intermediate_steps"],
         )
     ]
-    df = session.create_dataframe(data, schema=schema)
-
-    df.write.save_as_table(f"{prefix}_SUMMARIES", mode="append")
-
+    # Optional VARIANT columns, added to existing tables on first use.
+    extra_columns = {"CLUSTERS": clusters, "DEDUP_GROUPS": dedup_groups}
+    extra_columns = {name: value for name, value in extra_columns.items() if value is not None}
+    for name, value in extra_columns.items():
+        fields.append(StructField(name.lower(), VariantType()))
+        data[0] += (value,)
+
+    with session_pool.session(query_tag="process_cases") as session:
+        df = session.create_dataframe(data, schema=StructType(fields))
+
+        for name in extra_columns:
+            session.sql(
+                f"ALTER TABLE IF EXISTS {prefix}_SUMMARIES ADD COLUMN IF NOT EXISTS {name} VARIANT"
+            ).collect()
+        df.write.save_as_table(f"{prefix}_SUMMARIES", mode="append", column_order="name")
+
+        if cortex_search:
+            support_pd = snapshot.index_table(session, categories, weeks_back)
+
+            support_pd.write.save_as_table(f"{prefix}_CASES", mode="append", column_order="name")
+
+            session.sql(
+                f"""
+            CREATE OR REPLACE CORTEX SEARCH SERVICE {prefix}_CORTEX_SEARCH
+                        ON INDEX_TEXT
+                        WAREHOUSE = {str(os.getenv("DATAOPS_PREFIX") + "_DATA_APP_WH")}
+                        TARGET_LAG = '1 day'
+                        AS (
+                            SELECT INDEX_TEXT, DATE_CREATED, CASE_TITLE, CASE_ID FROM {prefix}_CASES
+                        )
+            """
+            ).collect()
+
+    query_cache.invalidate(f"{prefix}_SUMMARIES", SUMMARY_TABLES)
     if cortex_search:
-        support_pd = support_tickets.with_column(
-            "INDEX_TEXT",
-            concat(
-                lit("##### \nCASE TITLE: "),
-                col("CASE_TITLE"),
-                lit("\n\nCASE DESCRIPTION: "),
-                col("CASE_DESCRIPTION"),
-                lit("\n\nCASE STATUS: "),
-                col("STATUS"),
-                lit("\n\nLAST COMMENT: "),
-                col("LAST_UPDATE"),
-            ),
-        )
-
-        support_pd.write.save_as_table(f"{prefix}_CASES", mode="append")
-
-        session.sql(
-            f"""
-        CREATE OR REPLACE CORTEX SEARCH SERVICE {prefix}_CORTEX_SEARCH
-                    ON INDEX_TEXT
-                    WAREHOUSE = {str(os.getenv("DATAOPS_PREFIX") + "_DATA_APP_WH")}
-                    TARGET_LAG = '1 day'
-                    AS (
-                        SELECT INDEX_TEXT, DATE_CREATED, CASE_TITLE, CASE_ID FROM {prefix}_CASES
-                    )
-        """
-        ).collect()
+        query_cache.invalidate(f"{prefix}_CASES", CORTEX_SEARCH_SERVICES)
     return llm.total_tokens
@@ -0,0 +1,127 @@
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Callable, Hashable
+
+# Sources that aren't tables, so there is no LAST_ALTERED to version them by.
+# They are refreshed when process_cases invalidates them or when their TTL expires.
+SUMMARY_TABLES = "SHOW TABLES LIKE '%SUM%'"
+CORTEX_SEARCH_SERVICES = "SHOW CORTEX SEARCH SERVICES"
+
+
+def _sizeof(value: Any) -> int:
+    if hasattr(value, "memory_usage"):  # pandas DataFrame
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(sys.getsizeof(item) for item in value)
+    return sys.getsizeof(value)
+
+
+class QueryCache:
+    """An LRU cache for read queries, keyed on the query and its source's version.
+
+    Table-backed entries are reused until the table's LAST_ALTERED changes. The
+    version itself is only looked up once every ``version_ttl`` seconds, so
+    widget reruns within that window cost no warehouse queries at all.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        max_bytes: int = 64 * 1024 * 1024,
+        version_ttl: float = 30,
+        unversioned_ttl: float = 300,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.version_ttl = version_ttl
+        self.unversioned_ttl = unversioned_ttl
+
+        self._entries = OrderedDict()  # (source, key) -> (version, loaded_at, size, value)
+        self._bytes = 0
+        self._versions = {}  # source -> (checked_at, last_altered)
+        self._generations = defaultdict(int)
+        self._lock = threading.RLock()
+
+    def get(
+        self,
+        session,
+        source: str,
+        key: Hashable,
+        loader: Callable[[], Any],
+        versioned: bool = True,
+    ) -> Any:
+        source = source.upper()
+        version = self._version(session, source, versioned)
+        cache_key = (source, key)
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is not None and entry[0] == version and (
+                versioned or time.monotonic() - entry[1] < self.unversioned_ttl
+            ):
+                self._entries.move_to_end(cache_key)
+                return entry[3]
+
+        value = loader()
+        self._store(cache_key, version, value)
+        return value
+
+    def invalidate(self, *sources: str):
+        sources = {source.upper() for source in sources}
+        with self._lock:
+            for source in sources:
+                self._generations[source] += 1
+                self._versions.pop(source, None)
+            for cache_key in [k for k in self._entries if k[0] in sources]:
+                self._evict(cache_key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+            self._bytes = 0
+
+    def _version(self, session, source: str, versioned: bool) -> tuple:
+        with self._lock:
+            generation = self._generations[source]
+            if not versioned:
+                return (generation,)
+            checked = self._versions.get(source)
+        if checked is not None and time.monotonic() - checked[0] < self.version_ttl:
+            return (generation, checked[1])
+
+        rows = session.sql(
+            """
+            SELECT MAX(LAST_ALTERED) FROM INFORMATION_SCHEMA.TABLES
+            WHERE TABLE_SCHEMA = CURRENT_SCHEMA() AND TABLE_NAME = :1
+            """,
+            (source,),
+        ).collect()
+        last_altered = rows[0][0] if rows else None
+        with self._lock:
+            self._versions[source] = (time.monotonic(), last_altered)
+        return (generation, last_altered)
+
+    def _store(self, cache_key, version, value):
+        size = _sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if cache_key in self._entries:
+                self._evict(cache_key)
+            self._entries[cache_key] = (version, time.monotonic(), size, value)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._evict(next(iter(self._entries)))
+
+    def _evict(self, cache_key):
+        entry = self._entries.pop(cache_key)
+        self._bytes -= entry[2]
+
+
+query_cache = QueryCache(
+    max_entries=int(os.getenv("QUERY_CACHE_MAX_ENTRIES", 256)),
+    max_bytes=int(os.getenv("QUERY_CACHE_MAX_MB", 64)) * 1024 * 1024,
+)
@@ -0,0 +1,169 @@
+import threading
+import time
+from contextlib import contextmanager
+from queue import Empty, LifoQueue
+from typing import TYPE_CHECKING, Callable, Dict, Optional
+
+if TYPE_CHECKING:
+    from snowflake.snowpark import Session
+
+
+class SessionPool:
+    """A bounded pool of Snowpark sessions.
+
+    Each thread checks out its own session, so concurrent pages, users and
+    CortexLLM workers don't queue up behind a single connection. Nested
+    checkouts on the same thread reuse the session already held.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], "Session"],
+        size: int = 4,
+        role: Optional[str] = None,
+        warehouse: Optional[str] = None,
+        query_tag: Optional[str] = None,
+        health_check_interval: float = 60,
+        checkout_timeout: float = 300,
+    ):
+        if size < 1:
+            raise ValueError("Session pool size must be at least 1.")
+        self.factory = factory
+        self.size = size
+        self.role = role
+        self.warehouse = warehouse
+        self.query_tag = query_tag
+        self.health_check_interval = health_check_interval
+        self.checkout_timeout = checkout_timeout
+
+        self._idle = LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # Per-session bookkeeping: last time the session was known to be alive
+        # and the (role, warehouse, query_tag) last applied to it.
+        self._last_used: Dict[int, float] = {}
+        self._applied: Dict[int, tuple] = {}
+
+    @contextmanager
+    def session(
+        self,
+        query_tag: Optional[str] = None,
+        role: Optional[str] = None,
+        warehouse: Optional[str] = None,
+    ):
+        held = getattr(self._local, "session", None)
+        if held is not None:
+            yield held
+            return
+
+        session = self._checkout()
+        failed = False
+        try:
+            self._configure(
+                session,
+                role or self.role,
+                warehouse or self.warehouse,
+                query_tag or self.query_tag,
+            )
+            self._local.session = session
+            yield session
+        except BaseException:
+            failed = True
+            raise
+        finally:
+            self._local.session = None
+            self._checkin(session, failed)
+
+    def _checkout(self) -> "Session":
+        deadline = time.monotonic() + self.checkout_timeout
+        while True:
+            try:
+                session = self._idle.get_nowait()
+            except Empty:
+                session = self._create_if_below_limit()
+                if session is not None:
+                    return session
+                try:
+                    session = self._idle.get(
+                        timeout=max(deadline - time.monotonic(), 0)
+                    )
+                except Empty:
+                    raise TimeoutError(
+                        f"No Snowflake session became available within {self.checkout_timeout}s "
+                        f"(pool size: {self.size})."
+                    )
+
+            if self._is_healthy(session):
+                return session
+            print("Discarding unhealthy Snowflake session and reconnecting.")
+            self._discard(session)
+
+    def _checkin(self, session: "Session", failed: bool = False):
+        # A session that raised may have lost its connection; treat it as idle
+        # since forever so the next checkout health-checks it first.
+        self._last_used[id(session)] = 0 if failed else time.monotonic()
+        self._idle.put(session)
+
+    def _create_if_below_limit(self) -> Optional["Session"]:
+        with self._lock:
+            if self._created >= self.size:
+                return None
+            self._created += 1
+        try:
+            return self._new_session()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def _new_session(self) -> "Session":
+        session = self.factory()
+        self._last_used[id(session)] = time.monotonic()
+        return session
+
+    def _discard(self, session: "Session"):
+        self._last_used.pop(id(session), None)
+        self._applied.pop(id(session), None)
+        with self._lock:
+            self._created -= 1
+        try:
+            session.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, session: "Session") -> bool:
+        idle_for = time.monotonic() - self._last_used.get(id(session), 0)
+        if idle_for < self.health_check_interval:
+            return True
+        try:
+            session.sql("SELECT 1").collect()
+            return True
+        except Exception as e:
+            print(f"Snowflake session health check failed: {str(e)}")
+            return False
+
+    def _configure(self, session: "Session", role, warehouse, query_tag):
+        # Only issue the statements whose setting differs from what the
+        # session last had applied.
+        applied_role, applied_warehouse, applied_query_tag = self._applied.get(
+            id(session), (None, None, None)
+        )
+        if role and role != applied_role:
+            session.use_role(role)
+            applied_role = role
+        if warehouse and warehouse != applied_warehouse:
+            session.use_warehouse(warehouse)
+            applied_warehouse = warehouse
+        if query_tag != applied_query_tag:
+            session.query_tag = query_tag
+            applied_query_tag = query_tag
+        self._applied[id(session)] = (applied_role, applied_warehouse, applied_query_tag)
+
+    def close(self):
+        while True:
+            try:
+                session = self._idle.get_nowait()
+            except Empty:
+                break
+            self._discard(session)
@@ -0,0 +1,83 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import streamlit as st
+
+TIKTOKEN_CACHE_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), "..", "..", "tiktoken_file")
+)
+ENCODING_NAME = "cl100k_base"
+
+# Seconds each page may spend on its top-level imports before a warning is logged.
+PAGE_IMPORT_BUDGETS = {
+    "Summary": 0.5,
+    "CortexSearch": 1.0,
+    "ProcessCases": 1.0,
+}
+
+
+@contextmanager
+def import_budget(page):
+    """Time a page's imports and log when they exceed the page's budget."""
+    budget = float(
+        os.getenv(f"{page.upper()}_IMPORT_BUDGET", PAGE_IMPORT_BUDGETS.get(page, 1.0))
+    )
+    start = time.perf_counter()
+    yield
+    elapsed = time.perf_counter() - start
+    if elapsed > budget:
+        print(f"[startup] {page} imports took {elapsed:.2f}s (budget {budget:.2f}s)")
+    elif os.getenv("DEBUG", False):
+        print(f"[startup] {page} imports took {elapsed:.2f}s")
+
+
+def get_encoding():
+    # Point tiktoken at the bundled cl100k_base file so it never downloads it.
+    os.environ.setdefault("TIKTOKEN_CACHE_DIR", TIKTOKEN_CACHE_DIR)
+    import tiktoken
+
+    return tiktoken.get_encoding(ENCODING_NAME)
+
+
+def _warm_up(session_pool):
+    steps = [
+        ("tiktoken encoding", get_encoding),
+        ("snowflake session", lambda: _open_session(session_pool)),
+        ("cortex search handle", lambda: _search_root(session_pool)),
+        ("langchain", _import_langchain),
+    ]
+    for name, step in steps:
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception as e:
+            print(f"[startup] Warm-up of {name} failed: {str(e)}")
+            continue
+        print(f"[startup] Warmed up {name} in {time.perf_counter() - start:.2f}s")
+
+
+def _open_session(session_pool):
+    with session_pool.session(query_tag="warm_up"):
+        pass
+
+
+def _search_root(session_pool):
+    from .app_tools import get_search_root
+
+    get_search_root(session_pool)
+
+
+def _import_langchain():
+    import langchain.chains  # noqa: F401
+    import langchain_text_splitters  # noqa: F401
+    from . import cortex_llm  # noqa: F401
+
+
+@st.cache_resource
+def start_warm_up(_session_pool):
+    """Preload heavy dependencies once per process in a background thread."""
+    thread = threading.Thread(target=_warm_up, args=(_session_pool,), daemon=True)
+    thread.start()
+    return thread
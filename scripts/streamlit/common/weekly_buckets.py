@@ -0,0 +1,388 @@
+import threading
+from datetime import datetime, timedelta
+
+from snowflake.snowpark.functions import (
+    call_function,
+    col,
+    count,
+    date_trunc,
+    lit,
+    max,
+    to_date,
+    when_matched,
+    when_not_matched,
+)
+from snowflake.snowpark.types import (
+    BooleanType,
+    DateType,
+    LongType,
+    StringType,
+    StructField,
+    StructType,
+    TimestampType,
+)
+
+from .chains import (
+    NullProgress,
+    make_llm,
+    map_chain,
+    reduce_documents_chain,
+    run_with_progress,
+    split_cases,
+)
+from .dedup import collapse_cases, group_case_strings
+from .process_cases import case_string_expr
+
+# Widest window the app offers; background refreshes cover all of it.
+MAX_WEEKS_BACK = 26
+
+BUCKET_SCHEMA = StructType(
+    [
+        StructField("CATEGORY", StringType()),
+        StructField("WEEK_START", DateType()),
+        StructField("CASE_COUNT", LongType()),
+        StructField("FINGERPRINT", LongType()),
+        StructField("MODEL", StringType()),
+        StructField("DEDUP", BooleanType()),
+        StructField("SUMMARY", StringType()),
+        StructField("UPDATED_AT", TimestampType()),
+    ]
+)
+
+
+def bucket_table(prefix):
+    # Kept out of the Summary page's SHOW TABLES LIKE '%SUM%' listing.
+    return f"{prefix}_WEEKLY_BUCKETS"
+
+
+def window_start(latest_case_date, weeks_back):
+    """Monday of the earliest week in a window of weeks_back weeks ending at latest_case_date."""
+    latest_week = latest_case_date.date() - timedelta(days=latest_case_date.weekday())
+    return latest_week - timedelta(weeks=weeks_back - 1)
+
+
+def _week_start():
+    return to_date(date_trunc("week", col("DATE_CREATED")))
+
+
+def _ensure_bucket_table(session, prefix):
+    session.sql(
+        f"""
+        CREATE TABLE IF NOT EXISTS {bucket_table(prefix)} (
+            CATEGORY STRING,
+            WEEK_START DATE,
+            CASE_COUNT NUMBER,
+            FINGERPRINT NUMBER,
+            MODEL STRING,
+            DEDUP BOOLEAN,
+            SUMMARY STRING,
+            UPDATED_AT TIMESTAMP_NTZ
+        )
+        """
+    ).collect()
+    session.sql(
+        f"ALTER TABLE {bucket_table(prefix)} ADD COLUMN IF NOT EXISTS DEDUP BOOLEAN"
+    ).collect()
+
+
+def _current_weeks(session, categories, start, cases_table):
+    """Distinct (CATEGORY, WEEK_START) keys that currently have cases."""
+    return (
+        session.table(cases_table)
+        .filter(col("CATEGORY").isin(categories))
+        .filter(col("DATE_CREATED") >= lit(start))
+        .select(col("CATEGORY"), _week_start().alias("WEEK_START"))
+        .distinct()
+    )
+
+
+def drop_empty_buckets(session, prefix, categories, start, cases_table="SUPPORT_CASES"):
+    """Delete stored buckets from start onwards that no longer have any cases.
+
+    stale_buckets only sees weeks that still have cases, so a bucket whose
+    cases were all deleted or moved to another category is removed here.
+    """
+    stored = (
+        session.table(bucket_table(prefix))
+        .filter(col("CATEGORY").isin(categories))
+        .filter(col("WEEK_START") >= lit(start))
+        .select(col("CATEGORY"), col("WEEK_START"))
+    )
+    empty = stored.join(
+        _current_weeks(session, categories, start, cases_table),
+        on=["CATEGORY", "WEEK_START"],
+        how="leftanti",
+    )
+    target = session.table(bucket_table(prefix))
+    target.delete(
+        (target["CATEGORY"] == empty["CATEGORY"])
+        & (target["WEEK_START"] == empty["WEEK_START"]),
+        empty,
+    )
+
+
+def stale_buckets(
+    session, prefix, categories, start, model, dedup=True, cases_table="SUPPORT_CASES"
+):
+    """(category, week) buckets whose cases changed since their summary was stored.
+
+    A bucket's fingerprint is a HASH_AGG over its cases, so new, edited and
+    deleted cases all invalidate it; so does switching model or turning
+    near-duplicate collapsing on or off. Buckets left with no cases at all
+    are handled by drop_empty_buckets.
+    """
+    current = (
+        session.table(cases_table)
+        .filter(col("CATEGORY").isin(categories))
+        .filter(col("DATE_CREATED") >= lit(start))
+        .group_by(col("CATEGORY"), _week_start().alias("WEEK_START"))
+        .agg(
+            count(lit(1)).alias("CASE_COUNT"),
+            call_function(
+                "HASH_AGG",
+                col("CASE_ID"),
+                col("CASE_TITLE"),
+                col("CASE_DESCRIPTION"),
+                col("STATUS"),
+                col("LAST_UPDATE"),
+            ).alias("FINGERPRINT"),
+        )
+    )
+    stored = session.table(bucket_table(prefix)).select(
+        col("CATEGORY").alias("STORED_CATEGORY"),
+        col("WEEK_START").alias("STORED_WEEK_START"),
+        col("FINGERPRINT").alias("STORED_FINGERPRINT"),
+        col("MODEL").alias("STORED_MODEL"),
+        col("DEDUP").alias("STORED_DEDUP"),
+    )
+    return (
+        current.join(
+            stored,
+            (current["CATEGORY"] == stored["STORED_CATEGORY"])
+            & (current["WEEK_START"] == stored["STORED_WEEK_START"]),
+            "left",
+        )
+        .filter(
+            col("STORED_FINGERPRINT").is_null()
+            | (col("STORED_FINGERPRINT") != col("FINGERPRINT"))
+            | (col("STORED_MODEL") != lit(model))
+            | col("STORED_DEDUP").is_null()
+            | (col("STORED_DEDUP") != lit(dedup))
+        )
+        .select(col("CATEGORY"), col("WEEK_START"), col("CASE_COUNT"), col("FINGERPRINT"))
+        .to_pandas()
+    )
+
+
+def refresh_buckets(
+    session_pool,
+    llm,
+    prefix,
+    categories,
+    start,
+    model,
+    progress_bar,
+    dedup=True,
+    cases_table="SUPPORT_CASES",
+):
+    """Re-map every stale bucket from start onwards and store its summary.
+
+    cases_table is SUPPORT_CASES or a CaseSnapshot table covering every case
+    from start onwards. Returns the number of buckets refreshed.
+    """
+    with session_pool.session(query_tag="weekly_buckets") as session:
+        _ensure_bucket_table(session, prefix)
+        drop_empty_buckets(session, prefix, categories, start, cases_table)
+        stale = stale_buckets(session, prefix, categories, start, model, dedup, cases_table)
+        if stale.empty:
+            return 0
+
+        cases = (
+            session.table(cases_table)
+            .filter(col("CATEGORY").isin(stale["CATEGORY"].unique().tolist()))
+            .filter(col("DATE_CREATED") >= lit(stale["WEEK_START"].min()))
+            .select(
+                col("CASE_ID"),
+                col("CATEGORY"),
+                col("CASE_TITLE"),
+                col("CASE_DESCRIPTION"),
+                _week_start().alias("WEEK_START"),
+                case_string_expr().alias("CASE_STRING"),
+            )
+            .to_pandas()
+        )
+
+    # One map input per chunk, remembering which bucket each chunk came from.
+    buckets = cases.merge(stale[["CATEGORY", "WEEK_START"]], on=["CATEGORY", "WEEK_START"])
+    inputs, owners = [], []
+    for key, bucket_cases in buckets.groupby(["CATEGORY", "WEEK_START"]):
+        bucket_cases = bucket_cases.reset_index(drop=True)
+        if dedup:
+            case_strings = group_case_strings(bucket_cases, collapse_cases(bucket_cases))
+        else:
+            case_strings = bucket_cases["CASE_STRING"].astype(str).tolist()
+        for document in split_cases(case_strings):
+            inputs.append({"cases": document.page_content})
+            owners.append(key)
+
+    outputs = run_with_progress(
+        lambda handler: map_chain(llm, handler).apply(inputs), len(inputs), progress_bar
+    )
+    summaries = {}
+    for key, output in zip(owners, outputs):
+        summaries.setdefault(key, []).append(output["text"])
+
+    now = datetime.now()
+    rows = [
+        (
+            row.CATEGORY,
+            row.WEEK_START,
+            int(row.CASE_COUNT),
+            int(row.FINGERPRINT),
+            model,
+            dedup,
+            "\n\n".join(summaries.get((row.CATEGORY, row.WEEK_START), [])),
+            now,
+        )
+        for row in stale.itertuples()
+    ]
+
+    with session_pool.session(query_tag="weekly_buckets") as session:
+        target = session.table(bucket_table(prefix))
+        source = session.create_dataframe(rows, schema=BUCKET_SCHEMA)
+        values = {name: source[name] for name in BUCKET_SCHEMA.names}
+        target.merge(
+            source,
+            (target["CATEGORY"] == source["CATEGORY"])
+            & (target["WEEK_START"] == source["WEEK_START"]),
+            [when_matched().update(values), when_not_matched().insert(values)],
+        )
+    return len(rows)
+
+
+def summarize_window(
+    session_pool,
+    llm,
+    prefix,
+    categories,
+    latest_case_date,
+    weeks_back,
+    model,
+    progress_bar,
+    dedup=True,
+    cases_table="SUPPORT_CASES",
+):
+    """Answer a weeks_back window by reducing the stored weekly bucket summaries.
+
+    Only stale buckets are mapped first, so moving the window usually costs a
+    single reduce call. Returns a result shaped like MapReduceDocumentsChain's.
+    """
+    from langchain_core.documents import Document
+
+    start = window_start(latest_case_date, weeks_back)
+    refreshed = refresh_buckets(
+        session_pool, llm, prefix, categories, start, model, progress_bar, dedup, cases_table
+    )
+    print(f"Refreshed {refreshed} weekly buckets for {prefix}")
+
+    with session_pool.session(query_tag="weekly_buckets") as session:
+        # Only weeks that still have cases, even if a bucket outlived them.
+        stored = (
+            session.table(bucket_table(prefix))
+            .filter(col("CATEGORY").isin(categories))
+            .filter(col("WEEK_START") >= lit(start))
+            .join(
+                _current_weeks(session, categories, start, cases_table),
+                on=["CATEGORY", "WEEK_START"],
+                how="leftsemi",
+            )
+            .sort(col("WEEK_START"), col("CATEGORY"))
+            .to_pandas()
+        )
+    if stored.empty:
+        raise ValueError("No data found for the given filters.")
+
+    steps = [
+        f"CATEGORY: {row.CATEGORY} | WEEK OF {row.WEEK_START} ({row.CASE_COUNT} cases)\n\n{row.SUMMARY}"
+        for row in stored.itertuples()
+    ]
+    documents = [Document(page_content=step) for step in steps]
+    result = run_with_progress(
+        lambda handler: reduce_documents_chain(llm, handler).invoke(
+            {"input_documents": documents}
+        ),
+        0,
+        progress_bar,
+    )
+    return {"output_text": result["output_text"], "intermediate_steps": steps}
+
+
+def _refresh_loop(
+    session_pool, prefix, categories, weeks_back, model, concurrency, dedup, interval, stop
+):
+    llm = make_llm(session_pool, model, concurrency)
+    while not stop.is_set():
+        try:
+            with session_pool.session(query_tag="weekly_buckets") as session:
+                latest_case_date = (
+                    session.table("SUPPORT_CASES").select(max(col("DATE_CREATED"))).collect()[0][0]
+                )
+            start = window_start(latest_case_date, weeks_back)
+            refreshed = refresh_buckets(
+                session_pool, llm, prefix, categories, start, model, NullProgress(), dedup
+            )
+            print(f"Background refresh updated {refreshed} weekly buckets for {prefix}")
+        except Exception as e:
+            print(f"Background refresh of weekly buckets for {prefix} failed: {str(e)}")
+        stop.wait(interval)
+
+
+def start_background_refresh(
+    session_pool, prefix, categories, weeks_back, model, concurrency, dedup=True, interval=3600
+):
+    """Keep the buckets of the last weeks_back weeks fresh every interval seconds.
+
+    Returns an Event; set it to stop the refresh thread.
+    """
+    stop = threading.Event()
+    threading.Thread(
+        target=_refresh_loop,
+        args=(
+            session_pool, prefix, categories, weeks_back, model, concurrency, dedup, interval, stop
+        ),
+        daemon=True,
+    ).start()
+    return stop
+
+
+# One background refresher per prefix: prefix -> (settings, stop Event).
+_refreshers = {}
+_refreshers_lock = threading.Lock()
+
+
+def ensure_background_refresh(session_pool, prefix, categories, model, concurrency, dedup=True):
+    """Run exactly one refresher for prefix, restarting it when its settings change.
+
+    It covers MAX_WEEKS_BACK weeks so that any window the app can ask for
+    is already fresh.
+    """
+    settings = (tuple(sorted(categories)), model, concurrency, dedup)
+    with _refreshers_lock:
+        running = _refreshers.get(prefix)
+        if running is not None:
+            if running[0] == settings:
+                return
+            running[1].set()
+        _refreshers[prefix] = (
+            settings,
+            start_background_refresh(
+                session_pool, prefix, list(settings[0]), MAX_WEEKS_BACK, model, concurrency, dedup
+            ),
+        )
+
+
+def stop_background_refresh(prefix):
+    with _refreshers_lock:
+        running = _refreshers.pop(prefix, None)
+    if running is not None:
+        running[1].set()
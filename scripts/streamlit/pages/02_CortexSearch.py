@@ -1,9 +1,9 @@
-import os
 import streamlit as st  # Import python packages
-from snowflake.core import Root
-from snowflake.cortex import Complete
-from common.app_tools import connect_to_snowflake
-import altair as alt
+from common.startup import import_budget, start_warm_up
+
+with import_budget("CortexSearch"):
+    from common.app_tools import get_search_service, get_session_pool
+    from common.query_cache import query_cache, CORTEX_SEARCH_SERVICES
 
 COLUMNS = ["INDEX_TEXT", "DATE_CREATED","CASE_ID", "CASE_TITLE"]
 
@@ -15,14 +15,21 @@ MODELS = [
 ]
 
 # Establishing session
-session = connect_to_snowflake()
-root = Root(session)
+session_pool = get_session_pool()
+start_warm_up(session_pool)
 st.title(":balloon: Support Cases Chatbot with Snowflake Cortex")
 
 def init_config_options():
-    service_show = session.sql(
-        "SHOW CORTEX SEARCH SERVICES IN SCHEMA SUPPORT"
-    ).collect()
+    with session_pool.session(query_tag="cortex_search_page") as session:
+        service_show = query_cache.get(
+            session,
+            CORTEX_SEARCH_SERVICES,
+            "SUPPORT",
+            lambda: session.sql(
+                "SHOW CORTEX SEARCH SERVICES IN SCHEMA SUPPORT"
+            ).collect(),
+            versioned=False,
+        )
     SERVICES = [service[1] for service in service_show]
     st.sidebar.selectbox(
         "Select cortex search service:",
@@ -59,15 +66,11 @@ def init_messages():
         st.session_state.messages = []
 
 def query_cortex_search_service(query):
-    db, schema = session.get_current_database(), session.get_current_schema()
     references = []
 
-    cortex_search_service = (
-        root.databases[db]
-        .schemas[schema]
-        .cortex_search_services[st.session_state.cortex_search_service]
+    cortex_search_service = get_search_service(
+        session_pool, st.session_state.cortex_search_service
     )
-
     context_documents = cortex_search_service.search(
         query, COLUMNS, limit=st.session_state.num_retrieved_chunks
     )
@@ -106,7 +109,10 @@ def get_chat_history():
 
 
 def complete(model, prompt):
-    response = Complete(model, prompt).replace("$", "\$")
+    from snowflake.cortex import Complete
+
+    with session_pool.session(query_tag="cortex_search_page") as session:
+        response = Complete(model, prompt, session=session).replace("$", "\$")
     response = "\n".join([line.lstrip() for line in response.split("\n")])
     return response
 
@@ -1,12 +1,12 @@
-import os
-from common.process_cases import process_cases
-from common.app_tools import connect_to_snowflake
-
 import streamlit as st  # Import python packages
-from datetime import datetime, timedelta
+from common.startup import import_budget, start_warm_up
 
-from snowflake.snowpark.functions import col, max
+with import_budget("ProcessCases"):
+    from datetime import datetime, timedelta
 
+    from snowflake.snowpark.functions import col
+    from common.app_tools import get_session_pool
+    from common.query_cache import query_cache
 
 
 map_prompt = """Given the following support cases for an order, return a summary of each case.
@@ -34,7 +34,8 @@ if "initialized" not in st.session_state:
     st.session_state.initialized = True
     st.session_state.running = False
 
-session = connect_to_snowflake()
+session_pool = get_session_pool()
+start_warm_up(session_pool)
 
 
 ### Sidebar
@@ -60,19 +61,44 @@ with st.sidebar.expander("Prompts"):
     )
 
 create_cortext = st.sidebar.toggle("Create Cortex Search", value=True)
+collapse_duplicates = st.sidebar.toggle("Collapse near-duplicate cases", value=True)
+
+pipeline_mode = st.sidebar.radio(
+    "Pipeline mode",
+    ["map_reduce", "cluster", "weekly"],
+    format_func={
+        "map_reduce": "Summarize every case",
+        "cluster": "Cluster, then summarize samples",
+        "weekly": "Reduce stored weekly summaries",
+    }.get,
+)
+if pipeline_mode == "cluster":
+    with st.sidebar.expander("Clustering", expanded=True):
+        num_clusters = st.number_input("Clusters (0 = automatic)", 0, 100, 0)
+        cases_per_cluster = st.slider("Representative cases per cluster", 1, 20, 5)
+else:
+    num_clusters, cases_per_cluster = 0, 5
+refresh_in_background = pipeline_mode == "weekly" and st.sidebar.toggle(
+    "Refresh weekly summaries hourly", value=False
+)
+
 
 ### Main
 
 prefix = st.text_input("Prefix for summary", "ALL")
 
 
-case_categories = (
-    session.table("SUPPORT_CASES")
-    .select(col("CATEGORY"))
-    .distinct()
-    .to_pandas()
-    .sort_values("CATEGORY")
-)
+with session_pool.session(query_tag="process_cases_page") as session:
+    case_categories = query_cache.get(
+        session,
+        "SUPPORT_CASES",
+        "categories",
+        lambda: session.table("SUPPORT_CASES")
+        .select(col("CATEGORY"))
+        .distinct()
+        .to_pandas()
+        .sort_values("CATEGORY"),
+    )
 
 categories = st.multiselect(
     "Select Categories",
@@ -81,18 +107,41 @@ categories = st.multiselect(
     default=case_categories["CATEGORY"],
 )
 if categories:
-    st.expander("Preview cases").dataframe(
-        session.table("SUPPORT_CASES")
-        .select(
-            col("DATE_CREATED"),
-            col("CASE_TITLE"),
-            col("CATEGORY"),
+    with session_pool.session(query_tag="process_cases_page") as session:
+        # Keyed on the displayed start date, so reruns on the same day share a result.
+        st.expander("Preview cases").dataframe(
+            query_cache.get(
+                session,
+                "SUPPORT_CASES",
+                ("preview", tuple(sorted(categories)), formatted_date),
+                lambda: session.table("SUPPORT_CASES")
+                .select(
+                    col("DATE_CREATED"),
+                    col("CASE_TITLE"),
+                    col("CATEGORY"),
+                )
+                .filter(col("CATEGORY").isin(categories))
+                .filter(col("DATE_CREATED") > start_date)
+                .limit(1000)
+                .to_pandas(),
+            )
         )
-        .filter(col("CATEGORY").isin(categories))
-        .filter(col("DATE_CREATED") > start_date)
-        .limit(1000)
-        .to_pandas()
-    )
+
+    # One refresher per prefix; stop the one this session started when the
+    # toggle goes off or the prefix changes.
+    refreshing_prefix = st.session_state.get("weekly_refresh_prefix")
+    if refreshing_prefix and (not refresh_in_background or refreshing_prefix != prefix):
+        from common.weekly_buckets import stop_background_refresh
+
+        stop_background_refresh(refreshing_prefix)
+        st.session_state.weekly_refresh_prefix = None
+    if refresh_in_background:
+        from common.weekly_buckets import ensure_background_refresh
+
+        ensure_background_refresh(
+            session_pool, prefix, categories, "mistral-large", concurrency, collapse_duplicates
+        )
+        st.session_state.weekly_refresh_prefix = prefix
 
     if st.button("Process cases", disabled=st.session_state.running):
         st.session_state.running = True
@@ -115,14 +164,20 @@ if st.session_state.running:
         start_time = datetime.now()
 
         try:
+            from common.process_cases import process_cases
+
             total_tokens = process_cases(
-                session,
+                session_pool,
                 weeks,
                 categories,
                 prefix,
                 create_cortext,
                 progress_bar,
                 concurrency,
+                dedup=collapse_duplicates,
+                mode=pipeline_mode,
+                num_clusters=num_clusters or None,
+                cases_per_cluster=cases_per_cluster,
             )
             st.success("Processing complete. Check Summary tab.")
         except Exception as e: